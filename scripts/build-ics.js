@@ -14,42 +14,81 @@ const CURRENCIES = (process.env.FF_CURRENCIES || 'USD')
 // Múi giờ để đặt báo 8:00 sáng (theo yêu cầu)
 const NOTIFY_TZ = process.env.NOTIFY_TZ || 'Asia/Bangkok';
 
+// Hằng số dùng trong vòng lặp event — tạo 1 lần, không alloc lại mỗi vòng
+const PROD_ID = { company: 'Forex Factory', product: 'ff-ics', language: 'EN' };
+const DURATION_MS = 30 * 60 * 1000; // event kéo dài 30 phút
+const ALARM_BEFORE = -30 * 60; // -1800s = 30 phút trước
+
 const dataPath = path.join(OUTPUT_DIR, 'forexfactory.json');
 if (!fs.existsSync(dataPath)) { console.error('Missing forexfactory.json.'); process.exit(1); }
 const data = JSON.parse(fs.readFileSync(dataPath, 'utf8'));
 if (!Array.isArray(data) || data.length === 0) { console.error('Empty data.'); process.exit(2); }
 
-function impactDots(impact) {
-  switch ((impact || '').toUpperCase()) {
-    case 'LOW': return '•';
-    case 'MEDIUM': return '••';
-    case 'HIGH': return '•••';
-    default: return '';
+// Bảng tra thay cho switch — 1 property lookup cho mỗi event
+// Prefix có sẵn dấu cách: summary chỉ còn 1 phép nối chuỗi, không cần nhánh dots-rỗng
+const IMPACT_PREFIX = { LOW: '• ', MEDIUM: '•• ', HIGH: '••• ' };
+
+function impactPrefix(impact) {
+  // impact từ pull-ff-xml luôn là nhãn chuẩn HIGH/MEDIUM/LOW/UNKNOWN — tra thẳng, khỏi toUpperCase
+  return IMPACT_PREFIX[impact] || '';
+}
+
+// DTSTAMP chung cho cả run — không để ical-generator gọi new Date() cho từng event
+const stamp = new Date();
+
+// Nhiều event rơi cùng 1 ngày local -> cache mốc 08:00 theo ngày, khỏi dựng DateTime cho từng event
+const eightAmCache = new Map();
+
+function eightAmTrigger(startDate) {
+  // fromJSDate chỉ bọc lại mili-giây — rẻ hơn nhiều so với parse chuỗi ISO
+  const local = DateTime.fromJSDate(startDate, { zone: NOTIFY_TZ });
+  const key = local.toISODate();
+  let trigger = eightAmCache.get(key);
+  if (trigger === undefined) {
+    const eightLocal = DateTime.fromObject(
+      { year: local.year, month: local.month, day: local.day, hour: 8, minute: 0, second: 0 },
+      { zone: NOTIFY_TZ }
+    );
+    trigger = eightLocal.isValid ? eightLocal.toUTC().toJSDate() : null; // absolute trigger (UTC)
+    eightAmCache.set(key, trigger);
   }
+  return trigger;
+}
+
+// Gom event theo currency trong 1 lượt quét thay vì filter() lại toàn bộ data cho từng currency
+// Parse + validate startISO ngay tại đây luôn — vòng lặp emit phía dưới khỏi cần nhánh isValid
+const byCurrency = new Map(CURRENCIES.map(c => [c, []]));
+for (const ev of data) {
+  const bucket = byCurrency.get((ev.currency || '').toUpperCase());
+  if (!bucket) continue;
+  // startISO đã là UTC chuẩn từ pull-ff-xml: Date parse ISO native, khỏi qua format machinery của luxon
+  const startDate = new Date(ev.startISO);
+  if (isNaN(startDate.getTime())) { console.warn(`⚠️ Skip event with bad startISO: ${ev.id || ev.title}`); continue; }
+  bucket.push({ ev, startDate });
 }
 
 for (const cur of CURRENCIES) {
   const cal = ical({
     name: `Forex Factory ${cur}`,
     timezone: 'UTC',
-    prodId: { company: 'Forex Factory', product: 'ff-ics', language: 'EN' }
+    prodId: PROD_ID
   });
 
-  const items = data.filter(x => (x.currency || '').toUpperCase() === cur);
-
-  for (const ev of items) {
-    const startUtc = DateTime.fromISO(ev.startISO, { setZone: true }).toUTC();
-    if (!startUtc.isValid) continue;
+  const items = byCurrency.get(cur);
 
-    const uid = `${startUtc.toISO()}__${cur}__${slugify(ev.title || '', { lower: true, strict: true })}@ecocal`;
-    const dots = impactDots(ev.impact);
-    const summary = `${dots ? dots + ' ' : ''}${ev.title || ''}`.trim(); // chấm tròn TRƯỚC tên
+  for (const { ev, startDate } of items) {
+    // Đọc field event 1 lần vào local, khỏi lookup lặp lại trên ev
+    const { id, title = '', impact, startISO } = ev; // title đã trim sẵn từ pull-ff-xml
+    // pull-ff-xml đã tạo sẵn id = startISO__currency__slug — tái dùng, khỏi slugify + toISO lại
+    const uid = (id || `${startISO}__${cur}__${slugify(title, { lower: true, strict: true })}`) + '@ecocal';
+    const summary = impactPrefix(impact) + title; // chấm tròn TRƯỚC tên
 
     const event = cal.createEvent({
       id: uid,
       uid,
-      start: startUtc.toJSDate(),
-      end: startUtc.plus({ minutes: 30 }).toJSDate(),
+      stamp,
+      start: startDate,
+      end: new Date(startDate.getTime() + DURATION_MS),
       summary,
       // description: bỏ trống theo yêu cầu
       timezone: 'UTC'
@@ -59,22 +98,17 @@ for (const cur of CURRENCIES) {
     // ical-generator: trigger âm là giây trước event
     event.createAlarm({
       type: 'display',
-      trigger: -30 * 60 // -1800s = 30 phút trước
+      trigger: ALARM_BEFORE
     });
 
     // Alarm 2: lúc 08:00 sáng (Asia/Bangkok) cùng NGÀY với sự kiện
-    const eventLocalDay = startUtc.setZone(NOTIFY_TZ);
-    const eightLocal = DateTime.fromObject(
-      { year: eventLocalDay.year, month: eventLocalDay.month, day: eventLocalDay.day, hour: 8, minute: 0, second: 0 },
-      { zone: NOTIFY_TZ }
-    );
-    const eightUtc = eightLocal.toUTC(); // chuyển sang UTC để đặt absolute trigger
+    const eightAm = eightAmTrigger(startDate);
 
     // Chỉ tạo nếu 08:00 không invalid
-    if (eightUtc.isValid) {
+    if (eightAm) {
       event.createAlarm({
         type: 'display',
-        trigger: eightUtc.toJSDate() // absolute trigger (UTC)
+        trigger: eightAm
       });
     }
   }
@@ -1,31 +1,93 @@
 // scripts/pull-ff-xml.js
 import fs from 'fs';
 import path from 'path';
-import { DateTime } from 'luxon';
+import { DateTime, FixedOffsetZone, IANAZone } from 'luxon';
 import { XMLParser } from 'fast-xml-parser';
 import iconv from 'iconv-lite';
 import slugify from 'slugify';
 
 const OUTPUT_DIR = process.env.OUTPUT_DIR || 'out';
-const CURRENCIES = (process.env.FF_CURRENCIES || 'USD').split(',').map(s => s.trim().toUpperCase()).filter(Boolean);
-const IMPACTS = (process.env.FF_IMPACTS || 'LOW,MEDIUM,HIGH').split(',').map(s => s.trim().toUpperCase()).filter(Boolean);
+// Set để membership check O(1) trong vòng lặp event (thay vì Array.includes O(n))
+const CURRENCIES = new Set((process.env.FF_CURRENCIES || 'USD').split(',').map(s => s.trim().toUpperCase()).filter(Boolean));
+const IMPACTS = new Set((process.env.FF_IMPACTS || 'LOW,MEDIUM,HIGH').split(',').map(s => s.trim().toUpperCase()).filter(Boolean));
+// Mặc định giữ cả 3 mức -> filter không loại được gì, bỏ luôn phép check trong vòng lặp
+const IMPACT_FILTER_ACTIVE = !(IMPACTS.has('LOW') && IMPACTS.has('MEDIUM') && IMPACTS.has('HIGH'));
 const FEED_URL = process.env.FF_FEED_URL || 'https://nfs.faireconomy.media/ff_calendar_thisweek.xml';
 // 👉 Quan trọng: múi giờ của FEED (nếu thấy lệch 7h, đặt FEED_TZ=Asia/Bangkok)
 const FEED_TZ = process.env.FEED_TZ || 'UTC';
 
+// Regex compile 1 lần ở module scope, không tạo lại trong vòng lặp event
+const RE_ALL_DAY = /all\s*day/i;
+const RE_TIME = /^(\d{1,2}):(\d{2})\s*(am|pm)?$/i;  // khớp cả 5:15pm lẫn 14:00 trong 1 lần quét
+
+// Resolve zone 1 lần thành Zone object — khỏi normalize lại chuỗi FEED_TZ mỗi lần parse
+// Mặc định FEED_TZ=UTC: dùng fixed-offset zone, bỏ hẳn tra cứu IANA/DST cho mỗi event
+const FEED_ZONE = /^(utc|gmt|z)$/i.test(FEED_TZ) ? FixedOffsetZone.utcInstance : IANAZone.create(FEED_TZ);
+if (!FEED_ZONE.isValid) { console.error(`❌ Invalid FEED_TZ: ${FEED_TZ}`); process.exit(1); }
+
+// Options parse ngày/giờ không đổi giữa các event -> tạo 1 lần
+const FEED_OPTS = { zone: FEED_ZONE };
+
 function ensureDir(p) { if (!fs.existsSync(p)) fs.mkdirSync(p, { recursive: true }); }
+// 1 regex alternation duy nhất thay cho chuỗi toLowerCase + includes (quét string 1 lần)
+const RE_IMPACT = /high|med|low/i;
+// Dispatch bằng bảng tra theo text khớp được — không cần chuỗi if/else theo group
+const IMPACT_LABEL = { high: 'HIGH', med: 'MEDIUM', low: 'LOW' };
+
+// Feed chỉ có vài giá trị impact phân biệt -> cache kết quả theo raw string
+const impactCache = new Map();
+
+// Feed tuần chỉ có ~7 ngày phân biệt -> cache DateTime gốc theo dateStr (DateTime immutable)
+const dateCache = new Map();
+
+function parseFeedDate(dateStr) {
+  let base = dateCache.get(dateStr);
+  if (base === undefined) {
+    base = DateTime.fromFormat(dateStr, 'MM-dd-yyyy', FEED_OPTS);
+    dateCache.set(dateStr, base);
+  }
+  return base;
+}
+
 function impactNormalize(s) {
-  const t = String(s || '').toLowerCase();
-  if (t.includes('high')) return 'HIGH';
-  if (t.includes('medium') || t.includes('med')) return 'MEDIUM';
-  if (t.includes('low')) return 'LOW';
-  return 'UNKNOWN';
+  const raw = String(s || '');
+  let label = impactCache.get(raw);
+  if (label === undefined) {
+    const m = RE_IMPACT.exec(raw);
+    label = m ? IMPACT_LABEL[m[0].toLowerCase()] : 'UNKNOWN';
+    impactCache.set(raw, label);
+  }
+  return label;
 }
+const FETCH_RETRIES = 3;
+const RETRYABLE_STATUS = new Set([500, 502, 503, 504]);
+
 async function fetchArrayBuffer(url) {
-  const res = await fetch(url, { redirect: 'follow' });
-  if (!res.ok) throw new Error(`HTTP ${res.status} for ${url}`);
-  const ab = await res.arrayBuffer();
-  return Buffer.from(ab);
+  // Retry các lỗi tạm thời (5xx / network) với backoff, keep-alive do undici lo
+  let lastErr;
+  for (let attempt = 0; attempt <= FETCH_RETRIES; attempt++) {
+    if (attempt > 0) await new Promise(r => setTimeout(r, 1000 * attempt));
+    let res;
+    try {
+      // accept-encoding tường minh: feed ~vài trăm KB XML, gzip giảm ~10x bytes qua mạng
+      res = await fetch(url, { redirect: 'follow', headers: { 'accept-encoding': 'gzip, deflate, br' } });
+    } catch (err) {
+      lastErr = err;
+      if (attempt >= FETCH_RETRIES) break;
+      console.warn(`⚠️ Fetch failed (${err.message}), retry ${attempt + 1}/${FETCH_RETRIES}...`);
+      continue;
+    }
+    if (!res.ok) {
+      if (RETRYABLE_STATUS.has(res.status) && attempt < FETCH_RETRIES) {
+        console.warn(`⚠️ HTTP ${res.status}, retry ${attempt + 1}/${FETCH_RETRIES}...`);
+        continue;
+      }
+      throw new Error(`HTTP ${res.status} for ${url}`);
+    }
+    const ab = await res.arrayBuffer();
+    return Buffer.from(ab);
+  }
+  throw lastErr;
 }
 
 (async () => {
@@ -36,63 +98,76 @@ async function fetchArrayBuffer(url) {
   const xml = iconv.decode(buf, 'windows-1252');
 
   const parser = new XMLParser({
-    ignoreAttributes: false, attributeNamePrefix: '@_', trimValues: true, parseTagValue: true
+    // parseTagValue: false — mọi field đều được String() ở dưới, khỏi cần ép kiểu số khi parse
+    // ignoreAttributes: true — feed chỉ dùng tag value, bỏ qua attribute cho nhẹ tree
+    ignoreAttributes: true, trimValues: true, parseTagValue: false
   });
   const data = parser.parse(xml);
 
-  const events = [].concat(data?.weeklyevents?.event || []);
+  // Không copy mảng event qua [].concat — chỉ bọc lại khi feed trả về 1 event đơn lẻ
+  const rawEvents = data?.weeklyevents?.event;
+  const events = Array.isArray(rawEvents) ? rawEvents : rawEvents ? [rawEvents] : [];
   console.log('Total raw events from feed:', events.length, '| FEED_TZ =', FEED_TZ);
 
   const out = [];
+  const seen = new Set();  // dedup ngay trong vòng lặp chính, khỏi quét lại toàn bộ out
   for (const ev of events) {
     const currency = String(ev.country || ev.currency || '').toUpperCase();
-    if (!currency || !CURRENCIES.includes(currency)) continue;
+    if (!currency || !CURRENCIES.has(currency)) continue;
     const title = String(ev.title || '').trim();
     if (!title) continue;
 
     const impact = impactNormalize(ev.impact);
-    if (impact !== 'UNKNOWN' && !IMPACTS.includes(impact)) continue;
+    if (IMPACT_FILTER_ACTIVE && impact !== 'UNKNOWN' && !IMPACTS.has(impact)) continue;
 
     const dateStr = String(ev.date || '').trim();  // ex: 08-23-2025
     const timeStr = String(ev.time || '').trim();  // ex: 5:15pm | 14:00 | All Day | -
 
     // Parse THEO FEED_TZ
-    const base = DateTime.fromFormat(dateStr, 'MM-dd-yyyy', { zone: FEED_TZ });
+    const base = parseFeedDate(dateStr);
     if (!base.isValid) continue;
 
     let startLocal;
-    if (/all\s*day/i.test(timeStr) || timeStr === '-' || timeStr === '') {
+    // So sánh rẻ trước, regex sau cùng
+    if (timeStr === '' || timeStr === '-' || RE_ALL_DAY.test(timeStr)) {
       startLocal = base.set({ hour: 0, minute: 0, second: 0 });
     } else {
-      let dt = DateTime.fromFormat(`${dateStr} ${timeStr}`, 'MM-dd-yyyy h:mma', { zone: FEED_TZ });
-      if (!dt.isValid) dt = DateTime.fromFormat(`${dateStr} ${timeStr}`, 'MM-dd-yyyy H:mm', { zone: FEED_TZ });
-      if (dt.isValid) startLocal = dt;
+      // 1 regex thay cho 2 lần fromFormat (mỗi lần parse lại cả dateStr)
+      const m = RE_TIME.exec(timeStr);
+      if (m) {
+        let hour = parseInt(m[1], 10);
+        const minute = parseInt(m[2], 10);
+        const ampm = m[3] ? m[3].toLowerCase() : '';
+        if (ampm) hour = (hour % 12) + (ampm === 'pm' ? 12 : 0);
+        if (hour <= 23 && minute <= 59) startLocal = base.set({ hour, minute, second: 0 });
+      }
     }
     if (!startLocal || !startLocal.isValid) continue;
 
     // Chuẩn hoá về UTC để downstream đồng nhất
     const startUtc = startLocal.toUTC();
+    const startISO = startUtc.toISO(); // format 1 lần, dùng cho cả id / key / field
+
+    const key = `${startISO}__${currency}__${title}`;
+    if (seen.has(key)) continue;
+    seen.add(key);
 
     out.push({
-      id: `${startUtc.toISO()}__${currency}__${slugify(title.slice(0,100), { lower: true, strict: true })}`,
+      id: `${startISO}__${currency}__${slugify(title.slice(0,100), { lower: true, strict: true })}`,
       title,
       currency,
       impact,
-      startISO: startUtc.toISO(), // UTC ISO
+      startISO, // UTC ISO
       tz: 'UTC',
       source: 'ff_weekly_xml'
     });
   }
 
-  out.sort((a,b) => (a.startISO||'').localeCompare(b.startISO||''));
-  const seen = new Set();
-  const uniq = out.filter(e => {
-    const k = `${e.startISO}__${e.currency}__${e.title}`;
-    if (seen.has(k)) return false; seen.add(k); return true;
-  });
+  // ISO UTC string so sánh thô là đúng thứ tự thời gian — khỏi localeCompare (đắt hơn nhiều)
+  out.sort((a,b) => a.startISO < b.startISO ? -1 : a.startISO > b.startISO ? 1 : 0);
 
   const outJson = path.join(OUTPUT_DIR, 'forexfactory.json');
-  fs.writeFileSync(outJson, JSON.stringify(uniq, null, 2), 'utf8');
-  console.log(`✅ Saved ${uniq.length} filtered events (normalized to UTC) -> ${outJson}`);
-  if (uniq.length === 0) { console.error('❌ 0 events after filters.'); process.exit(2); }
+  fs.writeFileSync(outJson, JSON.stringify(out, null, 2), 'utf8');
+  console.log(`✅ Saved ${out.length} filtered events (normalized to UTC) -> ${outJson}`);
+  if (out.length === 0) { console.error('❌ 0 events after filters.'); process.exit(2); }
 })();